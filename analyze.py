@@ -0,0 +1,36 @@
+import argparse
+import pandas as pd
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score eval result JSONL files produced by the eval scripts")
+    parser.add_argument('files', nargs='+', help="Result JSONL files to analyze")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Columnar ops over the output files keep scoring O(N) in C instead of
+    # Python loops, and cleanly separate "run eval" from "score eval"
+    df = pd.concat([pd.read_json(f, lines=True) for f in args.files], ignore_index=True)
+    print(f"Loaded {len(df)} results from {len(args.files)} file(s)")
+
+    print(f"\n{'='*60}")
+    print("ACCURACY BY MODEL AND SUBJECT")
+    print(f"{'='*60}")
+    accuracy = df.groupby(['model', 'subject'])['is_correct'].agg(['mean', 'count'])
+    print(accuracy.to_string(float_format=lambda x: f"{x:.3f}"))
+
+    if 'attempts' in df.columns:
+        retried = int((df['attempts'] > 1).sum())
+        cached = int((df['attempts'] == 0).sum())
+        print(f"\nRequests needing retries: {retried}")
+        print(f"Answers served from cache: {cached}")
+
+    if 'reasoning_length' in df.columns:
+        print(f"\n{'='*60}")
+        print("REASONING LENGTH (chars)")
+        print(f"{'='*60}")
+        print(df.groupby('model')['reasoning_length'].describe().to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import hashlib
+import json
+
+import diskcache
+
+CACHE_DIR = "./.llm_cache"
+
+class ResponseCache:
+    """On-disk exact-match cache for deterministic chat completions.
+
+    Keys on (model, messages, temperature) and only stores temperature=0
+    requests, where identical inputs yield identical outputs. Re-running an
+    eval over the same questions then costs zero tokens and no API latency.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._cache = diskcache.Cache(CACHE_DIR) if enabled else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model, messages, temperature):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _cacheable(self, temperature):
+        return self.enabled and temperature == 0
+
+    def get(self, model, messages, temperature):
+        """Return the cached value for this request, or None on a miss"""
+        if not self._cacheable(temperature):
+            return None
+        hit = self._cache.get(self._key(model, messages, temperature))
+        if hit is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def set(self, model, messages, temperature, value):
+        """Store a response value; no-op for non-deterministic requests"""
+        if self._cacheable(temperature):
+            self._cache.set(self._key(model, messages, temperature), value)
+
+    def report(self):
+        if self.enabled:
+            print(f"Response cache: {self.hits} hits, {self.misses} misses")
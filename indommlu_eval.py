@@ -1,144 +1,407 @@
-import json
+import argparse
+import asyncio
+import glob
+import orjson
 import os
-from openai import OpenAI
+from collections import defaultdict
+from functools import lru_cache
+import httpx
+import openai
+from openai import AsyncOpenAI
 from tqdm import tqdm
 from datetime import datetime
 
-def load_jsonl(file_path):
-    """Load data from JSONL file"""
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
+from cache import ResponseCache
+from rate_limit import RateLimiter, estimate_tokens, with_backoff
+
+# Number of batches evaluated concurrently against the API
+CONCURRENCY = 10
+
+# Questions packed into a single chat completion request
+BATCH_SIZE = 10
+
+def chunked(seq, k):
+    """Split a list into consecutive chunks of at most k items"""
+    for i in range(0, len(seq), k):
+        yield seq[i:i+k]
+
+def prompt_key(item):
+    """Items with the same question and options produce the same prompt"""
+    return (item['soal'], item['jawaban'])
+
+@lru_cache(maxsize=None)
+def letter_logit_bias(model):
+    """Logit bias forcing the answer onto the five option-letter tokens.
+
+    Only OpenAI-family models have a known tiktoken tokenizer; for anything
+    else (e.g. Anthropic via OpenRouter) this returns None and the caller
+    keeps the unconstrained request.
+    """
+    try:
+        import tiktoken
+        enc = tiktoken.encoding_for_model(model)
+    except (ImportError, KeyError):
+        return None
+    bias = {}
+    for letter in 'ABCDE':
+        for variant in (letter, ' ' + letter):
+            ids = enc.encode(variant)
+            if len(ids) == 1:
+                bias[ids[0]] = 100
+    return bias or None
+
+# Provider prompt caching rewards "static first, dynamic last": keep the
+# instruction text byte-identical at the start of every request so the provider
+# can serve the shared prefix from its cache, and append the question after it.
+STATIC_INSTRUCTIONS = """Pilihlah salah satu jawaban yang dianggap benar untuk soal pilihan ganda berikut!
+
+Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E). Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja."""
+
+STATIC_BATCH_INSTRUCTIONS = """Pilihlah salah satu jawaban yang dianggap benar untuk setiap soal pilihan ganda berikut!
+
+Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E), satu huruf per baris sesuai urutan soal. Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja."""
+
+# User-message templates built once at import; only the per-item fields are
+# interpolated per call, and a stable template keeps the prompt prefix
+# byte-identical for provider caching
+USER_TMPL = "Ini adalah soal {subject} untuk {level}.\n\n{soal}\n{jawaban}\nJawaban:"
+BATCH_USER_TMPL = "Ini adalah kumpulan soal {subject} untuk {level}.\n\n{questions}\nJawaban:"
+
+def build_messages(instructions, user_content):
+    """Static system block first (marked cacheable), dynamic question last"""
+    return [
+        {
+            "role": "system",
+            "content": [{
+                "type": "text",
+                "text": instructions,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        },
+        {"role": "user", "content": user_content}
+    ]
+
+def iter_jsonl(file_path):
+    """Lazily yield items from a JSONL file"""
+    with open(file_path, 'rb') as f:
         for line in f:
-            data.append(json.loads(line))
-    return data
+            yield orjson.loads(line)
 
-def evaluate_mcq(item, model, client):
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate models on IndoMMLU multiple choice questions")
+    parser.add_argument('--max-rpm', type=int, default=500, help="Maximum API requests per minute")
+    parser.add_argument('--max-tpm', type=int, default=200000, help="Maximum API tokens per minute")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the on-disk response cache")
+    parser.add_argument('--verbose', action='store_true', help="Print the first few questions and answers")
+    parser.add_argument('--resume', action='store_true', help="Continue each model's most recent run, skipping finished questions")
+    return parser.parse_args()
+
+async def evaluate_mcq(item, model, client, limiter, cache):
     """Evaluate a single multiple choice question"""
-    prompt = f"""Ini adalah soal {item['subject']} untuk {item['level']}. Pilihlah salah satu jawaban yang dianggap benar!
-
-{item['soal']}
-{item['jawaban']}
-
-Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E). Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja.
-Jawaban:"""
-    
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=10,
-        temperature=0
-    )
-    
-    predicted = response.choices[0].message.content.strip()
+    user_content = USER_TMPL.format_map(item)
+
+    messages = build_messages(STATIC_INSTRUCTIONS, user_content)
+    prompt = STATIC_INSTRUCTIONS + user_content
+
+    attempts = 0
+    predicted = cache.get(model, messages, 0)
+    if predicted is None:
+        bias = letter_logit_bias(model)
+        if bias is not None:
+            # Force a single letter token: ~10x fewer output tokens and the
+            # response is parseable by construction
+            try:
+                response, attempts = await with_backoff(
+                    lambda: client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=1,
+                        temperature=0,
+                        logit_bias=bias,
+                        stop=["\n"]
+                    ),
+                    limiter,
+                    estimate_tokens(prompt, 1)
+                )
+            except openai.BadRequestError:
+                # Provider rejected logit_bias; fall back to the plain request
+                bias = None
+        if bias is None:
+            response, attempts = await with_backoff(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=10,
+                    temperature=0
+                ),
+                limiter,
+                estimate_tokens(prompt, 10)
+            )
+        predicted = response.choices[0].message.content.strip()
+        cache.set(model, messages, 0, predicted)
+
     correct = item['kunci']
-    
+
     return {
         'id': item['id'],
         'predicted': predicted,
         'correct': correct,
-        'is_correct': predicted == correct
+        'is_correct': predicted == correct,
+        'attempts': attempts,
+        'final_status': 'ok'
     }
 
-def main():
-    # Configure OpenAI client for OpenRouter
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY")
+async def evaluate_mcq_batch(items, model, client, limiter, cache):
+    """Evaluate a batch of multiple choice questions with a single request.
+
+    Packing k questions into one completion uses 1/k of the request-per-minute
+    quota and amortizes network overhead. Any answer that doesn't parse to a
+    single letter falls back to an individual query for that question.
+    """
+    questions = "\n\n".join(
+        f"Soal {i+1}:\n{item['soal']}\n{item['jawaban']}"
+        for i, item in enumerate(items)
+    )
+    user_content = BATCH_USER_TMPL.format(
+        subject=items[0]['subject'], level=items[0]['level'], questions=questions
     )
-    
+
+    messages = build_messages(STATIC_BATCH_INSTRUCTIONS, user_content)
+    prompt = STATIC_BATCH_INSTRUCTIONS + user_content
+
+    attempts = 0
+    content = cache.get(model, messages, 0)
+    if content is None:
+        response, attempts = await with_backoff(
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=2 * len(items),
+                temperature=0
+            ),
+            limiter,
+            estimate_tokens(prompt, 2 * len(items))
+        )
+        content = response.choices[0].message.content.strip()
+        cache.set(model, messages, 0, content)
+
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+
+    # Positional alignment is only trustworthy when the response is exactly one
+    # parseable letter per question. Any extra line (a preamble, a skipped
+    # question) shifts every answer after it and silently misgrades the rest of
+    # the batch, so on any mismatch re-query the whole batch individually.
+    if len(lines) != len(items) or any(line not in ('A', 'B', 'C', 'D', 'E') for line in lines):
+        return [await evaluate_mcq(item, model, client, limiter, cache) for item in items]
+
+    return [
+        {
+            'id': item['id'],
+            'predicted': predicted,
+            'correct': item['kunci'],
+            'is_correct': predicted == item['kunci'],
+            'attempts': attempts,
+            'final_status': 'ok'
+        }
+        for item, predicted in zip(items, lines)
+    ]
+
+async def main():
+    args = parse_args()
+    cache = ResponseCache(enabled=not args.no_cache)
+
     if not os.getenv("OPENROUTER_API_KEY"):
         print("Error: OPENROUTER_API_KEY environment variable not set!")
         print("Please set it with: export OPENROUTER_API_KEY=your_api_key")
         return
-    
+
     # Models to evaluate
     models = [
         "anthropic/claude-sonnet-4"
     ]
-    
-    # Load and filter data
+
+    # Load and filter data lazily so only the questions under evaluation are kept in memory
     print("Loading data...")
     try:
-        data = load_jsonl('indoMMLU.jsonl')
+        filtered_data = [
+            item for item in iter_jsonl('indoMMLU.jsonl')
+            if item['level'] == 'Seleksi PTN' and item['is_for_fewshot'] == '0' and item['subject'] == 'Bahasa Indonesia'
+        ]
     except FileNotFoundError:
         print("Error: indoMMLU.jsonl file not found!")
         print("Please make sure the file exists in the current directory.")
         return
-    
-    filtered_data = [item for item in data if item['level'] == 'Seleksi PTN' and item['is_for_fewshot'] == '0' and item['subject'] == 'Bahasa Indonesia']
     print(f"Loaded {len(filtered_data)} Bahasa Indonesia questions for evaluation")
-    
+
+    # Identical prompts only need one API call; the answer fans back out to
+    # every duplicate. Grouping is model-independent, so compute it once here.
+    groups = defaultdict(list)
+    for item in filtered_data:
+        groups[prompt_key(item)].append(item)
+    unique_data = [items[0] for items in groups.values()]
+    if len(unique_data) < len(filtered_data):
+        print(f"Deduplicated to {len(unique_data)} unique prompts ({len(filtered_data) - len(unique_data)} repeats)")
+
+    # httpx's HTTP/2 support is an optional extra (httpx[http2]); fall back to
+    # HTTP/1.1 with keep-alive when h2 isn't installed
+    try:
+        import h2
+        use_http2 = True
+    except ImportError:
+        use_http2 = False
+
+    # Configure OpenAI client for OpenRouter with an explicit HTTP/2 pool so
+    # concurrent requests multiplex over kept-alive connections instead of
+    # paying a TCP+TLS handshake each
+    client = AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        http_client=httpx.AsyncClient(
+            http2=use_http2,
+            limits=httpx.Limits(max_connections=CONCURRENCY * len(models), max_keepalive_connections=CONCURRENCY * len(models)),
+            timeout=httpx.Timeout(120.0, connect=10.0)
+        )
+    )
+
     all_model_results = {}
-    
-    for model in models:
-        print(f"\n{'='*50}")
-        print(f"Evaluating model: {model}")
-        print(f"{'='*50}")
-        
-        # Create output file for this model at the start
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Per-model state: each model gets its own semaphore, rate limiter, output
+    # file, and progress bar so independent upstreams are saturated in parallel.
+    # All (model, batch) tasks run under a single gather, finishing in roughly
+    # max(per-model time) instead of the sum.
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    states = {}
+    for position, model in enumerate(models):
         model_name = model.replace('/', '_')
         output_file = f"eval_results_{model_name}_{timestamp}.jsonl"
-        
-        print(f"Results will be saved incrementally to: {output_file}")
-        
-        results = []
-        correct_count = 0
-        
-        for i, item in enumerate(tqdm(filtered_data, desc=f"Evaluating {model}")):
-            try:
-                result = evaluate_mcq(item, model, client)
-                
-                # Add more details to result
-                result.update({
-                    'model': model,
-                    'subject': item['subject'],
-                    'soal': item['soal'],
-                    'jawaban': item['jawaban'],
-                    'sumber': item['sumber']
-                })
-                
-                results.append(result)
-                
-                # Save result immediately after evaluation
-                with open(output_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
-                
-                if result['is_correct']:
-                    correct_count += 1
-                
-                current_accuracy = correct_count / len(results)
-                
-                # Show first 10 outputs
-                if i < 10:
-                    status = "✓" if result['is_correct'] else "✗"
-                    print(f"\nQuestion {i+1} ({item['subject']}):")
-                    print(f"Predicted: {result['predicted']} | Correct: {result['correct']} {status}")
-                    print(f"Question: {item['soal'][:100]}...")
-                    print(f"Options: {item['jawaban']}")
+
+        # With --resume, append to the model's most recent output file and skip
+        # every question already answered there; failed rows are retried
+        done_ids = set()
+        if args.resume:
+            existing = sorted(glob.glob(f"eval_results_{model_name}_*.jsonl"))
+            if existing:
+                output_file = existing[-1]
+                done_ids = {r['id'] for r in iter_jsonl(output_file) if r.get('final_status') != 'failed'}
+                print(f"Resuming {model} from {output_file}: {len(done_ids)} questions already done")
+
+        pending = [item for item in unique_data if item['id'] not in done_ids]
+        print(f"Results for {model} will be saved incrementally to: {output_file}")
+        states[model] = {
+            'sem': asyncio.Semaphore(CONCURRENCY),
+            'limiter': RateLimiter(args.max_rpm, args.max_tpm),
+            # Line-buffered so each result hits the file as soon as it's
+            # written, keeping the output crash-consistent
+            'out_f': open(output_file, 'a', encoding='utf-8', buffering=1),
+            'pbar': tqdm(total=len(pending), desc=f"Evaluating {model}", mininterval=0.5, position=position),
+            'output_file': output_file,
+            'pending': pending,
+            'n_seen': 0,
+            'correct_count': 0
+        }
+
+    async def run_batch(model, start, batch):
+        state = states[model]
+        try:
+            async with state['sem']:
+                batch_results = await evaluate_mcq_batch(batch, model, client, state['limiter'], cache)
+
+            for offset, (unique_item, unique_result) in enumerate(zip(batch, batch_results)):
+                i = start + offset
+                predicted = unique_result['predicted']
+
+                # Fan the predicted answer back out to every item sharing this prompt
+                for item in groups[prompt_key(unique_item)]:
+                    result = {
+                        'id': item['id'],
+                        'predicted': predicted,
+                        'correct': item['kunci'],
+                        'is_correct': predicted == item['kunci'],
+                        'attempts': unique_result['attempts'],
+                        'final_status': unique_result['final_status'],
+                        'model': model,
+                        'subject': item['subject'],
+                        'soal': item['soal'],
+                        'jawaban': item['jawaban'],
+                        'sumber': item['sumber']
+                    }
+
+                    # Save result immediately after evaluation
+                    state['out_f'].write(orjson.dumps(result).decode() + '\n')
+
+                    state['n_seen'] += 1
+                    if result['is_correct']:
+                        state['correct_count'] += 1
+
+                current_accuracy = state['correct_count'] / state['n_seen']
+
+                # Show first 10 outputs when asked; the progress bar's
+                # postfix carries the running accuracy otherwise
+                if args.verbose and i < 10:
+                    status = "✓" if predicted == unique_item['kunci'] else "✗"
+                    print(f"\nQuestion {i+1} ({unique_item['subject']}, {model}):")
+                    print(f"Predicted: {predicted} | Correct: {unique_item['kunci']} {status}")
+                    print(f"Question: {unique_item['soal'][:100]}...")
+                    print(f"Options: {unique_item['jawaban']}")
                     print(f"Running accuracy: {current_accuracy:.3f}")
                     print("-" * 60)
-                
-                # Show progress every 50 questions
-                if (i + 1) % 50 == 0:
-                    print(f"\nProgress: {i+1}/{len(filtered_data)} | Accuracy: {current_accuracy:.3f}")
-                    print(f"Results saved so far: {output_file}")
-                    
-            except Exception as e:
-                print(f"Error evaluating question {i+1}: {e}")
-                continue
-        
-        # Store results
-        final_accuracy = sum(r['is_correct'] for r in results) / len(results) if results else 0
+
+                state['pbar'].set_postfix(acc=f"{current_accuracy:.3f}", refresh=False)
+
+        except Exception as e:
+            print(f"Error evaluating batch starting at question {start+1} for {model}: {e}")
+            # Record a failure row per question so permanent failures show up
+            # in the output file instead of silently biasing accuracy, and so
+            # --resume knows to retry them
+            for unique_item in batch:
+                for item in groups[prompt_key(unique_item)]:
+                    result = {
+                        'id': item['id'],
+                        'predicted': None,
+                        'correct': item['kunci'],
+                        'is_correct': False,
+                        'attempts': getattr(e, 'attempts', 1),
+                        'final_status': 'failed',
+                        'model': model,
+                        'subject': item['subject'],
+                        'soal': item['soal'],
+                        'jawaban': item['jawaban'],
+                        'sumber': item['sumber']
+                    }
+                    state['out_f'].write(orjson.dumps(result).decode() + '\n')
+                    state['n_seen'] += 1
+        finally:
+            state['pbar'].update(len(batch))
+
+    await asyncio.gather(
+        *[run_batch(model, i * BATCH_SIZE, batch)
+          for model in models
+          for i, batch in enumerate(chunked(states[model]['pending'], BATCH_SIZE))],
+        return_exceptions=True
+    )
+
+    for model in models:
+        state = states[model]
+        state['pbar'].close()
+        state['out_f'].close()
+
+        # Final stats come from re-scanning the output file, the source of
+        # truth. Keep only the last row per id so a failure that was retried
+        # on a later resume isn't double-counted.
+        outcome_by_id = {}
+        for r in iter_jsonl(state['output_file']):
+            outcome_by_id[r['id']] = r['is_correct']
+        final_total = len(outcome_by_id)
+        final_correct = sum(outcome_by_id.values())
+        final_accuracy = final_correct / final_total if final_total else 0
         all_model_results[model] = {
             'accuracy': final_accuracy,
-            'results': results,
-            'output_file': output_file
+            'output_file': state['output_file']
         }
-        
+
         print(f"Final accuracy for {model}: {final_accuracy:.3f}")
-        print(f"All results saved to: {output_file}")
-    
+        print(f"All results saved to: {state['output_file']}")
+
     # Summary comparison
     print(f"\n{'='*60}")
     print("FINAL COMPARISON")
@@ -147,5 +410,8 @@ def main():
         print(f"{model}: {data['accuracy']:.3f}")
         print(f"  Results file: {data['output_file']}")
 
+    cache.report()
+    await client.close()
+
 if __name__ == "__main__":
-    main() 
+    asyncio.run(main())
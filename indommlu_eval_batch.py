@@ -0,0 +1,179 @@
+import orjson
+import os
+import time
+from openai import OpenAI
+from datetime import datetime
+
+# Seconds between batch status polls; batch jobs run minutes to hours
+POLL_INTERVAL = 60
+
+def iter_jsonl(file_path):
+    """Lazily yield items from a JSONL file"""
+    with open(file_path, 'rb') as f:
+        for line in f:
+            yield orjson.loads(line)
+
+# Same prompt split as the live eval script: static instructions first (so the
+# provider can cache the shared prefix), per-item fields formatted into a
+# module-level template
+STATIC_INSTRUCTIONS = """Pilihlah salah satu jawaban yang dianggap benar untuk soal pilihan ganda berikut!
+
+Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E). Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja."""
+
+USER_TMPL = "Ini adalah soal {subject} untuk {level}.\n\n{soal}\n{jawaban}\nJawaban:"
+
+def build_messages(item):
+    """Build the same single-question messages used by the live eval script"""
+    return [
+        {"role": "system", "content": STATIC_INSTRUCTIONS},
+        {"role": "user", "content": USER_TMPL.format_map(item)}
+    ]
+
+def write_batch_input(items, model, input_file):
+    """Write one Batch API request line per question, keyed by the item id"""
+    with open(input_file, 'w', encoding='utf-8') as f:
+        for item in items:
+            request = {
+                "custom_id": item['id'],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": build_messages(item),
+                    "max_tokens": 10,
+                    "temperature": 0
+                }
+            }
+            f.write(orjson.dumps(request).decode() + '\n')
+
+def submit_and_wait(client, input_file):
+    """Upload the input file, create the batch job, and poll until it finishes"""
+    with open(input_file, 'rb') as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id}, polling every {POLL_INTERVAL}s...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(POLL_INTERVAL)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+
+    return batch
+
+def parse_batch_output(client, batch):
+    """Download the batch output file and map custom_id -> predicted letter"""
+    content = client.files.content(batch.output_file_id)
+    predictions = {}
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        row = orjson.loads(line)
+        response = row.get('response')
+        if response and response.get('status_code') == 200:
+            body = response['body']
+            predictions[row['custom_id']] = body['choices'][0]['message']['content'].strip()
+    return predictions
+
+def main():
+    # Configure OpenAI client for OpenRouter
+    client = OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY")
+    )
+
+    if not os.getenv("OPENROUTER_API_KEY"):
+        print("Error: OPENROUTER_API_KEY environment variable not set!")
+        print("Please set it with: export OPENROUTER_API_KEY=your_api_key")
+        return
+
+    # Models to evaluate
+    models = [
+        "anthropic/claude-sonnet-4"
+    ]
+
+    # Load and filter data lazily so only the questions under evaluation are kept in memory
+    print("Loading data...")
+    try:
+        filtered_data = [
+            item for item in iter_jsonl('indoMMLU.jsonl')
+            if item['level'] == 'Seleksi PTN' and item['is_for_fewshot'] == '0' and item['subject'] == 'Bahasa Indonesia'
+        ]
+    except FileNotFoundError:
+        print("Error: indoMMLU.jsonl file not found!")
+        print("Please make sure the file exists in the current directory.")
+        return
+    print(f"Loaded {len(filtered_data)} Bahasa Indonesia questions for evaluation")
+
+    all_model_results = {}
+
+    for model in models:
+        print(f"\n{'='*50}")
+        print(f"Evaluating model via Batch API: {model}")
+        print(f"{'='*50}")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        model_name = model.replace('/', '_')
+        input_file = f"batch_input_{model_name}_{timestamp}.jsonl"
+        output_file = f"eval_results_batch_{model_name}_{timestamp}.jsonl"
+
+        write_batch_input(filtered_data, model, input_file)
+        print(f"Wrote {len(filtered_data)} requests to {input_file}")
+
+        batch = submit_and_wait(client, input_file)
+        if batch.status != "completed":
+            print(f"Batch for {model} ended with status: {batch.status}")
+            continue
+
+        predictions = parse_batch_output(client, batch)
+
+        results = []
+        correct_count = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for item in filtered_data:
+                predicted = predictions.get(item['id'], '')
+                result = {
+                    'id': item['id'],
+                    'predicted': predicted,
+                    'correct': item['kunci'],
+                    'is_correct': predicted == item['kunci'],
+                    'model': model,
+                    'subject': item['subject'],
+                    'soal': item['soal'],
+                    'jawaban': item['jawaban'],
+                    'sumber': item['sumber']
+                }
+                results.append(result)
+                if result['is_correct']:
+                    correct_count += 1
+                f.write(orjson.dumps(result).decode() + '\n')
+
+        final_accuracy = correct_count / len(results) if results else 0
+        missing = sum(1 for item in filtered_data if item['id'] not in predictions)
+
+        all_model_results[model] = {
+            'accuracy': final_accuracy,
+            'results': results,
+            'output_file': output_file
+        }
+
+        print(f"Final accuracy for {model}: {final_accuracy:.3f}")
+        if missing:
+            print(f"Warning: {missing} questions had no batch response")
+        print(f"All results saved to: {output_file}")
+
+    # Summary comparison
+    print(f"\n{'='*60}")
+    print("FINAL COMPARISON - BATCH API")
+    print(f"{'='*60}")
+    for model, data in all_model_results.items():
+        print(f"{model}: {data['accuracy']:.3f}")
+        print(f"  Results file: {data['output_file']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,130 @@
-import json
+import argparse
+import asyncio
+import glob
+import orjson
 import os
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from tqdm import tqdm
 from datetime import datetime
 import re
 
-def load_jsonl(file_path):
-    """Load data from JSONL file"""
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
+from rate_limit import RateLimiter, estimate_tokens, with_backoff
+
+# Reasoning calls can take tens of seconds each, so concurrency matters even more here
+CONCURRENCY = 10
+
+def iter_jsonl(file_path):
+    """Lazily yield items from a JSONL file"""
+    with open(file_path, 'rb') as f:
         for line in f:
-            data.append(json.loads(line))
-    return data
+            yield orjson.loads(line)
+
+# Reasoning traces can run to thousands of tokens; budget generously for TPM accounting
+REASONING_TOKEN_BUDGET = 8192
+
+# Characters kept from the end of a trace under --reasoning-store tail; the
+# final answer and its justification live there
+REASONING_TAIL_CHARS = 4096
+
+def trim_reasoning(result, mode):
+    """Shrink the stored reasoning trace according to --reasoning-store.
+
+    R1-family traces can exceed 50 KB each; trimming them before the write
+    keeps output files and peak memory proportional to what's actually wanted.
+    reasoning_length always keeps the full pre-trim character count so the
+    length statistics are unaffected by the storage mode.
+    """
+    reasoning = result['reasoning_content']
+    if mode == 'full' or not reasoning:
+        return result
+    if mode == 'tail':
+        result['reasoning_content'] = reasoning[-REASONING_TAIL_CHARS:]
+    elif mode == 'zstd':
+        import base64
+        import zstandard
+        compressed = zstandard.ZstdCompressor().compress(reasoning.encode())
+        result['reasoning_content_zstd_b64'] = base64.b64encode(compressed).decode()
+        result['reasoning_content'] = None
+    elif mode == 'none':
+        result['reasoning_content'] = None
+    return result
+
+# Compiled once at import instead of per response
+_LETTER_RE = re.compile(r'\b([ABCDE])\b')
+
+def extract_letter(predicted):
+    """Pull the single answer letter out of a model response.
+
+    The letter usually sits at the very end of the response, so scan the tail
+    first and only search the full string when that fails. Keeps extraction
+    O(final-answer-length) rather than O(response-length).
+    """
+    match = _LETTER_RE.search(predicted[-16:]) or _LETTER_RE.search(predicted)
+    if match:
+        return match.group(1)
+    # Fallback: take the first character if it's a valid option
+    return predicted[0] if predicted and predicted[0] in 'ABCDE' else predicted
+
+# Provider prompt caching rewards "static first, dynamic last": keep the
+# instruction text byte-identical at the start of every request so the provider
+# can serve the shared prefix from its cache, and append the question after it.
+STATIC_INSTRUCTIONS = """Pilihlah salah satu jawaban yang dianggap benar untuk soal pilihan ganda berikut!
+
+Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E). Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja."""
+
+# User-message template built once at import; only the per-item fields are
+# interpolated per call, and a stable template keeps the prompt prefix
+# byte-identical for provider caching
+USER_TMPL = "Ini adalah soal {subject} untuk {level}.\n\n{soal}\n{jawaban}\nJawaban:"
+
+def build_messages(instructions, user_content):
+    """Static system block first (marked cacheable), dynamic question last"""
+    return [
+        {
+            "role": "system",
+            "content": [{
+                "type": "text",
+                "text": instructions,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        },
+        {"role": "user", "content": user_content}
+    ]
 
-def evaluate_mcq_reasoning(item, model, client):
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate reasoning models on IndoMMLU multiple choice questions")
+    parser.add_argument('--max-rpm', type=int, default=500, help="Maximum API requests per minute")
+    parser.add_argument('--max-tpm', type=int, default=200000, help="Maximum API tokens per minute")
+    parser.add_argument('--verbose', action='store_true', help="Print the first few questions and answers")
+    parser.add_argument('--resume', action='store_true', help="Continue each model's most recent run, skipping finished questions")
+    parser.add_argument('--reasoning-store', choices=['full', 'tail', 'zstd', 'none'], default='full',
+                        help="How much of each reasoning trace to store in results")
+    return parser.parse_args()
+
+async def evaluate_mcq_reasoning(item, model, client, limiter):
     """Evaluate a single multiple choice question with reasoning model"""
-    prompt = f"""Ini adalah soal {item['subject']} untuk {item['level']}. Pilihlah salah satu jawaban yang dianggap benar!
+    user_content = USER_TMPL.format_map(item)
 
-{item['soal']}
-{item['jawaban']}
+    messages = build_messages(STATIC_INSTRUCTIONS, user_content)
 
-Jawab HANYA dengan huruf pilihan saja (A, B, C, D, atau E). Jangan tambahkan penjelasan awal atau akhir. Hanya output huruf pilihan saja.
-Jawaban:"""
-    
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
+    response, attempts = await with_backoff(
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=messages,
+        ),
+        limiter,
+        estimate_tokens(STATIC_INSTRUCTIONS + user_content, REASONING_TOKEN_BUDGET)
     )
-    
+
     # Extract both reasoning content and final answer
     reasoning_content = getattr(response.choices[0].message, 'reasoning_content', None)
     predicted = response.choices[0].message.content.strip()
     correct = item['kunci']
-    
+
     # Extract only the final letter from the predicted answer
-    # Look for single letters A, B, C, D, E in the final answer
-    letter_match = re.search(r'\b([ABCDE])\b', predicted)
-    if letter_match:
-        predicted_letter = letter_match.group(1)
-    else:
-        # Fallback: take the first character if it's a valid option
-        predicted_letter = predicted[0] if predicted and predicted[0] in 'ABCDE' else predicted
-    
+    predicted_letter = extract_letter(predicted)
+
     return {
         'id': item['id'],
         'predicted': predicted_letter,
@@ -49,124 +132,219 @@ Jawaban:"""
         'is_correct': predicted_letter == correct,
         'reasoning_content': reasoning_content,
         'reasoning_length': len(reasoning_content) if reasoning_content else 0,
-        'full_response': predicted  # Keep the full response for debugging
+        'full_response': predicted,  # Keep the full response for debugging
+        'attempts': attempts,
+        'final_status': 'ok'
     }
 
-def main():
-    # Configure OpenAI client for OpenRouter
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY")
-    )
-    
+async def main():
+    args = parse_args()
+
+    # Fail fast: trim_reasoning only imports zstandard when writing the first
+    # result, so a missing package would otherwise surface after the run has
+    # already spent money on API requests
+    if args.reasoning_store == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("Error: --reasoning-store zstd requires the zstandard package")
+            print("Please install it with: pip install zstandard")
+            return
+
     if not os.getenv("OPENROUTER_API_KEY"):
         print("Error: OPENROUTER_API_KEY environment variable not set!")
         print("Please set it with: export OPENROUTER_API_KEY=your_api_key")
         return
-    
+
     # Reasoning models to evaluate
     reasoning_models = [
         "deepseek/deepseek-r1-0528"
     ]
-    
-    # Load and filter data
+
+    # Load and filter data lazily so only the questions under evaluation are kept in memory
     print("Loading data...")
     try:
-        data = load_jsonl('indoMMLU.jsonl')
+        filtered_data = [
+            item for item in iter_jsonl('indoMMLU.jsonl')
+            if item['level'] == 'Seleksi PTN' and item['is_for_fewshot'] == '0' and item['subject'] == 'Bahasa Indonesia'
+        ]
     except FileNotFoundError:
         print("Error: indoMMLU.jsonl file not found!")
         print("Please make sure the file exists in the current directory.")
         return
-    
-    filtered_data = [item for item in data if item['level'] == 'Seleksi PTN' and item['is_for_fewshot'] == '0' and item['subject'] == 'Bahasa Indonesia']
     print(f"Loaded {len(filtered_data)} Bahasa Indonesia questions for evaluation")
-    
+
+    # httpx's HTTP/2 support is an optional extra (httpx[http2]); fall back to
+    # HTTP/1.1 with keep-alive when h2 isn't installed
+    try:
+        import h2
+        use_http2 = True
+    except ImportError:
+        use_http2 = False
+
+    # Configure OpenAI client for OpenRouter with an explicit HTTP/2 pool so
+    # concurrent requests multiplex over kept-alive connections instead of
+    # paying a TCP+TLS handshake each
+    client = AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        http_client=httpx.AsyncClient(
+            http2=use_http2,
+            limits=httpx.Limits(max_connections=CONCURRENCY * len(reasoning_models), max_keepalive_connections=CONCURRENCY * len(reasoning_models)),
+            timeout=httpx.Timeout(300.0, connect=10.0)
+        )
+    )
+
     all_model_results = {}
-    
-    for model in reasoning_models:
-        print(f"\n{'='*50}")
-        print(f"Evaluating reasoning model: {model}")
-        print(f"{'='*50}")
-        
-        # Create output file for this model at the start
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Per-model state: each model gets its own semaphore, rate limiter, output
+    # file, and progress bar so independent upstreams are saturated in parallel.
+    # All (model, item) tasks run under a single gather, finishing in roughly
+    # max(per-model time) instead of the sum.
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    states = {}
+    for position, model in enumerate(reasoning_models):
         model_name = model.replace('/', '_').replace(':', '_')
         output_file = f"eval_results_reasoning_{model_name}_{timestamp}.jsonl"
-        
-        print(f"Results will be saved incrementally to: {output_file}")
-        
-        results = []
-        correct_count = 0
-        total_reasoning_tokens = 0
-        
-        for i, item in enumerate(tqdm(filtered_data, desc=f"Evaluating {model}")):
-            try:
-                result = evaluate_mcq_reasoning(item, model, client)
-                
-                # Add more details to result
-                result.update({
-                    'model': model,
-                    'subject': item['subject'],
-                    'soal': item['soal'],
-                    'jawaban': item['jawaban'],
-                    'sumber': item['sumber']
-                })
-                
-                results.append(result)
-                
-                # Save result immediately after evaluation
-                with open(output_file, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
-                
-                if result['is_correct']:
-                    correct_count += 1
-                
-                total_reasoning_tokens += result['reasoning_length']
-                current_accuracy = correct_count / len(results)
-                avg_reasoning_length = total_reasoning_tokens / len(results)
-                
-                # Show first 10 outputs with reasoning info
-                if i < 10:
-                    status = "✓" if result['is_correct'] else "✗"
-                    print(f"\nQuestion {i+1} ({item['subject']}):")
-                    print(f"Predicted: {result['predicted']} | Correct: {result['correct']} {status}")
-                    print(f"Full response: {result['full_response'][:100]}...")
-                    print(f"Question: {item['soal'][:100]}...")
-                    print(f"Options: {item['jawaban']}")
-                    print(f"Reasoning length: {result['reasoning_length']} chars")
-                    if result['reasoning_content'] and len(result['reasoning_content']) > 0:
-                        print(f"Reasoning preview: {result['reasoning_content'][:200]}...")
-                    print(f"Running accuracy: {current_accuracy:.3f}")
-                    print(f"Avg reasoning length: {avg_reasoning_length:.1f}")
-                    print("-" * 60)
-                
-                # Show progress every 50 questions
-                if (i + 1) % 50 == 0:
-                    print(f"\nProgress: {i+1}/{len(filtered_data)} | Accuracy: {current_accuracy:.3f} | Avg reasoning: {avg_reasoning_length:.1f}")
-                    print(f"Results saved so far: {output_file}")
-                    
-            except Exception as e:
-                print(f"Error evaluating question {i+1}: {e}")
-                continue
-        
-        # Calculate statistics
-        final_accuracy = sum(r['is_correct'] for r in results) / len(results) if results else 0
-        avg_reasoning_length = sum(r['reasoning_length'] for r in results) / len(results) if results else 0
-        reasoning_usage_rate = sum(1 for r in results if r['reasoning_length'] > 0) / len(results) if results else 0
-        
+
+        # With --resume, append to the model's most recent output file and skip
+        # every question already answered there; failed rows are retried
+        done_ids = set()
+        if args.resume:
+            existing = sorted(glob.glob(f"eval_results_reasoning_{model_name}_*.jsonl"))
+            if existing:
+                output_file = existing[-1]
+                done_ids = {r['id'] for r in iter_jsonl(output_file) if r.get('final_status') != 'failed'}
+                print(f"Resuming {model} from {output_file}: {len(done_ids)} questions already done")
+
+        pending = [item for item in filtered_data if item['id'] not in done_ids]
+        print(f"Results for {model} will be saved incrementally to: {output_file}")
+        states[model] = {
+            'sem': asyncio.Semaphore(CONCURRENCY),
+            'limiter': RateLimiter(args.max_rpm, args.max_tpm),
+            # Line-buffered so each result hits the file as soon as it's
+            # written, keeping the output crash-consistent
+            'out_f': open(output_file, 'a', encoding='utf-8', buffering=1),
+            'pbar': tqdm(total=len(pending), desc=f"Evaluating {model}", mininterval=0.5, position=position),
+            'output_file': output_file,
+            'pending': pending,
+            'n_seen': 0,
+            'correct_count': 0,
+            'total_reasoning_chars': 0
+        }
+
+    async def run_one(model, i, item):
+        state = states[model]
+        try:
+            async with state['sem']:
+                result = await evaluate_mcq_reasoning(item, model, client, state['limiter'])
+
+            result = trim_reasoning(result, args.reasoning_store)
+
+            # Add more details to result
+            result.update({
+                'model': model,
+                'subject': item['subject'],
+                'soal': item['soal'],
+                'jawaban': item['jawaban'],
+                'sumber': item['sumber']
+            })
+
+            # Save result immediately after evaluation
+            state['out_f'].write(orjson.dumps(result).decode() + '\n')
+
+            state['n_seen'] += 1
+            if result['is_correct']:
+                state['correct_count'] += 1
+
+            state['total_reasoning_chars'] += result['reasoning_length']
+            current_accuracy = state['correct_count'] / state['n_seen']
+            avg_reasoning_length = state['total_reasoning_chars'] / state['n_seen']
+
+            # Show first 10 outputs with reasoning info when asked; the
+            # progress bar's postfix carries the running stats otherwise
+            if args.verbose and i < 10:
+                status = "✓" if result['is_correct'] else "✗"
+                print(f"\nQuestion {i+1} ({item['subject']}, {model}):")
+                print(f"Predicted: {result['predicted']} | Correct: {result['correct']} {status}")
+                print(f"Full response: {result['full_response'][:100]}...")
+                print(f"Question: {item['soal'][:100]}...")
+                print(f"Options: {item['jawaban']}")
+                print(f"Reasoning length: {result['reasoning_length']} chars")
+                if result['reasoning_content'] and len(result['reasoning_content']) > 0:
+                    print(f"Reasoning preview: {result['reasoning_content'][:200]}...")
+                print(f"Running accuracy: {current_accuracy:.3f}")
+                print(f"Avg reasoning length: {avg_reasoning_length:.1f}")
+                print("-" * 60)
+
+            state['pbar'].set_postfix(acc=f"{current_accuracy:.3f}", reasoning=f"{avg_reasoning_length:.0f}", refresh=False)
+
+        except Exception as e:
+            print(f"Error evaluating question {i+1} for {model}: {e}")
+            # Record a failure row so permanent failures show up in the output
+            # file instead of silently biasing accuracy, and so --resume knows
+            # to retry them
+            result = {
+                'id': item['id'],
+                'predicted': None,
+                'correct': item['kunci'],
+                'is_correct': False,
+                'reasoning_content': None,
+                'reasoning_length': 0,
+                'full_response': None,
+                'attempts': getattr(e, 'attempts', 1),
+                'final_status': 'failed',
+                'model': model,
+                'subject': item['subject'],
+                'soal': item['soal'],
+                'jawaban': item['jawaban'],
+                'sumber': item['sumber']
+            }
+            state['out_f'].write(orjson.dumps(result).decode() + '\n')
+            state['n_seen'] += 1
+        finally:
+            state['pbar'].update(1)
+
+    await asyncio.gather(
+        *[run_one(model, i, item)
+          for model in reasoning_models
+          for i, item in enumerate(states[model]['pending'])],
+        return_exceptions=True
+    )
+
+    for model in reasoning_models:
+        state = states[model]
+        state['pbar'].close()
+        state['out_f'].close()
+
+        # Final stats come from re-scanning the output file, the source of
+        # truth. Keep only the last row per id so a failure that was retried
+        # on a later resume isn't double-counted.
+        last_by_id = {}
+        for r in iter_jsonl(state['output_file']):
+            last_by_id[r['id']] = (r['is_correct'], r['reasoning_length'])
+
+        final_total = len(last_by_id)
+        final_correct = sum(ok for ok, _ in last_by_id.values())
+        total_chars = sum(length for _, length in last_by_id.values())
+        used_reasoning = sum(1 for _, length in last_by_id.values() if length > 0)
+
+        final_accuracy = final_correct / final_total if final_total else 0
+        avg_reasoning_length = total_chars / final_total if final_total else 0
+        reasoning_usage_rate = used_reasoning / final_total if final_total else 0
+
         all_model_results[model] = {
             'accuracy': final_accuracy,
             'avg_reasoning_length': avg_reasoning_length,
             'reasoning_usage_rate': reasoning_usage_rate,
-            'results': results,
-            'output_file': output_file
+            'output_file': state['output_file']
         }
-        
+
         print(f"Final accuracy for {model}: {final_accuracy:.3f}")
         print(f"Average reasoning length: {avg_reasoning_length:.1f} characters")
         print(f"Reasoning usage rate: {reasoning_usage_rate:.1%}")
-        print(f"All results saved to: {output_file}")
-    
+        print(f"All results saved to: {state['output_file']}")
+
     # Summary comparison
     print(f"\n{'='*60}")
     print("FINAL COMPARISON - REASONING MODELS")
@@ -179,5 +357,7 @@ def main():
         print(f"  Results file: {data['output_file']}")
         print()
 
+    await client.close()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
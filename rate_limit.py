@@ -0,0 +1,74 @@
+import asyncio
+import random
+import time
+
+import openai
+
+def estimate_tokens(prompt, max_tokens):
+    """Rough token estimate for capacity accounting (~4 chars per token)"""
+    return len(prompt) // 4 + max_tokens
+
+class RateLimiter:
+    """Token-bucket limiter tracking both requests-per-minute and tokens-per-minute.
+
+    Capacity refills continuously based on elapsed time, so sustained throughput
+    sits near the configured ceiling instead of bursting into 429s and stalling.
+    """
+
+    def __init__(self, max_rpm, max_tpm):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self.requests_available = float(max_rpm)
+        self.tokens_available = float(max_tpm)
+        self._last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self.requests_available = min(
+            float(self.max_rpm),
+            self.requests_available + self.max_rpm * elapsed / 60.0
+        )
+        self.tokens_available = min(
+            float(self.max_tpm),
+            self.tokens_available + self.max_tpm * elapsed / 60.0
+        )
+
+    async def acquire(self, estimated_tokens):
+        """Wait until there is capacity for one request of the given token size"""
+        while True:
+            self._refill()
+            if self.requests_available >= 1 and self.tokens_available >= estimated_tokens:
+                self.requests_available -= 1
+                self.tokens_available -= estimated_tokens
+                return
+            await asyncio.sleep(0.1)
+
+# Transient failures worth retrying; anything else (auth, bad request,
+# content policy) is permanent and should surface immediately
+RETRYABLE_EXCEPTIONS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+async def with_backoff(make_request, limiter, estimated_tokens, max_attempts=5):
+    """Issue a rate-limited request, retrying transient failures with
+    exponential backoff and jitter.
+
+    Returns (response, attempts) so callers can record how many tries a
+    question needed; when retries are exhausted the raised exception carries
+    the count as an `attempts` attribute. Non-retryable errors raise on the
+    first occurrence rather than burning attempts.
+    """
+    for attempt in range(1, max_attempts + 1):
+        await limiter.acquire(estimated_tokens)
+        try:
+            return await make_request(), attempt
+        except RETRYABLE_EXCEPTIONS as exc:
+            if attempt == max_attempts:
+                exc.attempts = attempt
+                raise
+            delay = min(2 ** (attempt - 1) + random.random(), 30)
+            await asyncio.sleep(delay)